@@ -1,13 +1,23 @@
 import os
 import csv
-import glob
-import json
-import logging
+import orjson
 import time
+import heapq
+import functools
+import asyncio
+import sqlite3
+import logging
+import itertools
 from datetime import datetime
+from operator import itemgetter
+import httpx
 from dotenv import load_dotenv
-from openai import AzureOpenAI
-from typing import List, Dict, Any
+from openai import AsyncAzureOpenAI
+from typing import List, Dict, Any, AsyncIterator, Iterable, Iterator, Optional
+from config import CACHE_ENABLED
+from utils.cache_helper import open_cache, make_cache_key, get_cached_ratings, store_ratings
+from utils.semantic_cache import SemanticCache
+from utils.csv_helper import COMMIT_FIELDS, CSV_BUFFER_SIZE
 
 # Set up logging
 logging.basicConfig(
@@ -24,25 +34,172 @@ endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "API_ENDPOINT")
 deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4.1")
 api_key = os.getenv("AZURE_OPENAI_API_KEY", "InsertyourAPIKeyHeret")
 
+# Number of rating batches allowed in flight at the same time
+default_concurrency = int(os.getenv("AZURE_OPENAI_CONCURRENCY", "10"))
+
+# Rate limits of the deployment, used to pace requests before Azure rejects them
+requests_per_minute = int(os.getenv("AZURE_OPENAI_RPM", "720"))
+tokens_per_minute = int(os.getenv("AZURE_OPENAI_TPM", "120000"))
+
 # Best practice: Use a stable API version
-api_version = "2023-07-01-preview"  # More stable version than preview versions
+api_version = "2024-02-01"  # Stable GA version with tool calling support
+
+# Cache of previous ratings, keyed by deployment, prompt and commit message
+cache_path = os.getenv("RATING_CACHE_PATH", "cache.db")
+
+# Optional semantic cache that reuses ratings of near-duplicate commit messages.
+# Requires the sentence-transformers and faiss-cpu packages
+semantic_cache_enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() == "true"
+semantic_cache_path = os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.faiss")
+semantic_cache_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# Ask for a reason alongside each score. Reasons cost roughly 30 output
+# tokens per commit, so they are off unless requested
+include_reasons = os.getenv("RATING_INCLUDE_REASONS", "False").lower() == "true"
+
+# System prompt for evaluation. It is a module-level constant with no
+# per-batch content, so every request starts with the same bytes (tools,
+# then this prompt) and deployments with prompt caching can reuse the prefix.
+# The varying commit messages always come last, in the user message
+SYSTEM_PROMPT = """You are an expert at evaluating Git commit message quality.
+Rate each commit message on a scale of 1-10 based on:
+- Clarity: Is the purpose of the change clear?
+- Specificity: Does it provide specific details about what changed?
+- Completeness: Does it explain the why behind the change?
+- Format: Does it follow conventional commit format?
+
+Call the rate function with one score per numbered commit message, in the order the messages are given."""
+
+# Function the model is forced to call, so scores come back as compact
+# structured arguments instead of free-form JSON
+RATE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "rate",
+        "description": "Record the quality score of each commit message",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "scores": {
+                    "type": "array",
+                    "description": "One score per commit message, in order",
+                    "items": {"type": "integer", "minimum": 1, "maximum": 10}
+                }
+            },
+            "required": ["scores"]
+        }
+    }
+}
+if include_reasons:
+    RATE_TOOL["function"]["parameters"]["properties"]["reasons"] = {
+        "type": "array",
+        "description": "One short reason per commit message, in the same order as the scores",
+        "items": {"type": "string"}
+    }
+    RATE_TOOL["function"]["parameters"]["required"].append("reasons")
 
-def create_azure_openai_client() -> AzureOpenAI:
-    """Create Azure OpenAI client with best practices for resilience and security"""
+# Output budget per commit: a score is a couple of tokens plus JSON separators,
+# a reason a few dozen. The batch budget scales with the batch size so larger
+# batches don't truncate the tool-call arguments
+OUTPUT_TOKENS_BASE = 20
+OUTPUT_TOKENS_PER_COMMIT = 40 if include_reasons else 4
+
+# Ratings are cached against everything that shapes the answer, so changing
+# the prompt or the tool schema invalidates previously cached scores
+PROMPT_FINGERPRINT = SYSTEM_PROMPT + orjson.dumps(RATE_TOOL).decode()
+
+# Reason recorded for commits whose batch could not be rated
+RATING_FAILED = "Rating failed"
+
+# Columns of the rated commits CSV, in output order
+RATED_FIELDS = COMMIT_FIELDS + ('quality_score', 'quality_reason')
+
+@functools.lru_cache(maxsize=1)
+def create_azure_openai_client() -> AsyncAzureOpenAI:
+    """
+    Create Azure OpenAI client with best practices for resilience and security
+    
+    The client is created once and shared, so the connection test and every
+    rating batch reuse the same HTTP/2 connection pool instead of each
+    paying for a new TCP and TLS handshake.
+    """
     logger.info(f"Initializing Azure OpenAI client with endpoint: {endpoint}")
     
     # Initialize client with Azure best practices
-    client = AzureOpenAI(
+    client = AsyncAzureOpenAI(
         api_version=api_version,
         azure_endpoint=endpoint,
         api_key=api_key,
         max_retries=3,               # Add retry logic for resilience
         timeout=30.0,                # Set reasonable timeout
+        http_client=httpx.AsyncClient(
+            http2=True,              # Multiplex concurrent batches over one connection
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=50),
+        ),
     )
     
     return client
 
-def test_azure_connection() -> bool:
+class TokenBucket:
+    """
+    Paces API calls to stay within a requests-per-minute and tokens-per-minute budget
+    
+    Both buckets start full and refill continuously. Callers await acquire()
+    before each request, so requests are delayed up front instead of being
+    rejected with a 429 and retried.
+    """
+    
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.available_requests = float(rpm)
+        self.available_tokens = float(tpm)
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    def _refill(self) -> None:
+        """Add capacity for the time elapsed since the last refill"""
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.available_requests = min(self.rpm, self.available_requests + elapsed * self.rpm / 60)
+        self.available_tokens = min(self.tpm, self.available_tokens + elapsed * self.tpm / 60)
+    
+    async def acquire(self, tokens: int) -> None:
+        """Wait until one request and the estimated number of tokens are available"""
+        # A single request can never need more than the whole bucket
+        tokens = min(tokens, self.tpm)
+        
+        # Holding the lock while waiting serves callers in arrival order
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= tokens
+                    return
+                
+                wait_time = max(
+                    (1 - self.available_requests) * 60 / self.rpm,
+                    (tokens - self.available_tokens) * 60 / self.tpm
+                )
+                await asyncio.sleep(wait_time)
+    
+    def sync_from_headers(self, headers: Any) -> None:
+        """Lower the remaining capacity to what Azure reports in the rate limit headers"""
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        
+        self._refill()
+        try:
+            if remaining_requests is not None:
+                self.available_requests = min(self.available_requests, float(remaining_requests))
+            if remaining_tokens is not None:
+                self.available_tokens = min(self.available_tokens, float(remaining_tokens))
+        except ValueError:
+            logger.debug(f"Ignoring unparseable rate limit headers: {remaining_requests}, {remaining_tokens}")
+
+async def test_azure_connection() -> bool:
     """Test the Azure OpenAI connection and report status"""
     try:
         logger.info("Testing Azure OpenAI connection...")
@@ -51,7 +208,7 @@ def test_azure_connection() -> bool:
         # Best practice: Use a lightweight API call to test connectivity
         models = client.models.list()
         logger.info("Connection successful. Available models:")
-        for model in models:
+        async for model in models:
             logger.info(f" - {model.id}")
         return True
         
@@ -61,105 +218,97 @@ def test_azure_connection() -> bool:
 
 def find_latest_commits_csv() -> str:
     """Find the most recent commits CSV file"""
-    csv_files = glob.glob("commits_*.csv")
-    if not csv_files:
+    # A single directory scan: DirEntry caches its stat() result and is_file()
+    # uses the type from the listing, so each match is stat'ed at most once
+    with os.scandir('.') as entries:
+        latest_entry = max(
+            (entry for entry in entries
+             if entry.name.startswith('commits_') and entry.name.endswith('.csv') and entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime,
+            default=None
+        )
+    if latest_entry is None:
         raise FileNotFoundError("No commits_*.csv files found in the current directory")
     
-    # Sort by modification time (newest first)
-    latest_file = max(csv_files, key=os.path.getmtime)
+    latest_file = latest_entry.name
     logger.info(f"Using latest commits file: {latest_file}")
     return latest_file
 
-def read_commits_from_csv(file_path: str) -> List[Dict[str, str]]:
-    """Read commits from a CSV file"""
-    commits = []
-    try:
-        with open(file_path, mode='r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                commits.append(row)
-        logger.info(f"Successfully read {len(commits)} commits from {file_path}")
-        return commits
-    except Exception as e:
-        logger.error(f"Error reading CSV file: {str(e)}")
-        raise
+def iter_commits(file_path: str) -> Iterator[Dict[str, str]]:
+    """Stream commits from a CSV file one row at a time"""
+    logger.info(f"Reading commits from {file_path}")
+    with open(file_path, mode='r', encoding='utf-8', newline='', buffering=CSV_BUFFER_SIZE) as file:
+        yield from csv.DictReader(file)
 
-def rate_commit_quality(commits: List[Dict[str, str]], batch_size: int = 10) -> List[Dict[str, Any]]:
+async def _rate_batch(
+    client: AsyncAzureOpenAI,
+    batch: List[Dict[str, Any]],
+    batch_number: int,
+    semaphore: asyncio.Semaphore,
+    bucket: TokenBucket
+) -> List[Dict[str, Any]]:
     """
-    Rate the quality of commits using Azure OpenAI
+    Rate a single batch of commits, retrying with exponential backoff
     
     Args:
-        commits: List of commit dictionaries from CSV
-        batch_size: Number of commits to process in each API call
+        client: Azure OpenAI client shared by all batches
+        batch: Commits to rate in one API call
+        batch_number: 1-based position of the batch, used for logging
+        semaphore: Limits how many batches are in flight at once
+        bucket: Paces requests to the deployment's rate limits
         
     Returns:
-        List of commits with added quality scores
+        The batch with quality scores added to each commit
     """
-    logger.info(f"Rating quality of {len(commits)} commits using Azure OpenAI")
-    client = create_azure_openai_client()
-    
-    # Process commits in batches to manage rate limits
-    rated_commits = []
-    for i in range(0, len(commits), batch_size):
-        batch = commits[i:i+batch_size]
-        logger.info(f"Processing batch {i//batch_size + 1}/{(len(commits) + batch_size - 1)//batch_size}")
+    async with semaphore:
+        logger.info(f"Processing batch {batch_number}")
         
         # Create a batch of commit messages for evaluation
         commit_messages = []
         for j, commit in enumerate(batch):
             commit_messages.append(f"[{j+1}] {commit.get('commit_message', 'No message')}")
         
-        # Prepare system prompt for evaluation
-        system_prompt = """
-        You are an expert at evaluating Git commit message quality. 
-        Rate each commit message on a scale of 1-10 based on:
-        - Clarity: Is the purpose of the change clear?
-        - Specificity: Does it provide specific details about what changed?
-        - Completeness: Does it explain the why behind the change?
-        - Format: Does it follow conventional commit format?
-        
-        Format your response as a JSON object with an array of evaluations:
-        {
-          "evaluations": [
-            {"index": 1, "score": 8, "reason": "Clear and specific with conventional format"},
-            {"index": 2, "score": 3, "reason": "Too vague, missing context and rationale"}
-          ]
-        }
-        """
+        # Azure counts max_tokens against the TPM quota, so include it in the estimate
+        max_tokens = OUTPUT_TOKENS_BASE + OUTPUT_TOKENS_PER_COMMIT * len(batch)
+        estimated_tokens = len(PROMPT_FINGERPRINT) // 4 + sum(len(m) // 4 for m in commit_messages) + max_tokens
         
         # Use retry logic with exponential backoff
         max_retries = 3
         retry_count = 0
-        success = False
         
-        while not success and retry_count < max_retries:
+        while retry_count < max_retries:
             try:
+                # Wait for rate limit capacity before calling the API
+                await bucket.acquire(estimated_tokens)
+                
                 # Call Azure OpenAI for evaluation
-                response = client.chat.completions.create(
+                raw_response = await client.chat.completions.with_raw_response.create(
                     model=deployment,
                     messages=[
-                        {"role": "system", "content": system_prompt},
+                        {"role": "system", "content": SYSTEM_PROMPT},
                         {"role": "user", "content": "\n".join(commit_messages)}
                     ],
                     temperature=0.0,  # Use deterministic output for consistency
-                    max_tokens=4000,
-                    response_format={"type": "json_object"}  # Ensure response is valid JSON
+                    max_tokens=max_tokens,
+                    tools=[RATE_TOOL],
+                    tool_choice={"type": "function", "function": {"name": "rate"}}  # Always answer through the rate function
                 )
+                bucket.sync_from_headers(raw_response.headers)
+                response = raw_response.parse()
                 
-                # Parse the evaluation results
-                result = json.loads(response.choices[0].message.content)
-                evaluations = result.get("evaluations", [])
+                # Parse the evaluation results from the function arguments
+                tool_call = response.choices[0].message.tool_calls[0]
+                result = orjson.loads(tool_call.function.arguments)
+                scores = result.get("scores", [])
+                reasons = result.get("reasons", [])
                 
-                # Add scores to the commits
-                for eval_data in evaluations:
-                    idx = eval_data.get("index", 0) - 1  # Convert 1-based to 0-based index
-                    if 0 <= idx < len(batch):
-                        batch[idx]["quality_score"] = eval_data.get("score", 0)
-                        batch[idx]["quality_reason"] = eval_data.get("reason", "No reason provided")
+                # Add scores to the commits, matched by position
+                for idx, score in enumerate(scores[:len(batch)]):
+                    batch[idx]["quality_score"] = score
+                    batch[idx]["quality_reason"] = reasons[idx] if idx < len(reasons) else "No reason provided"
                 
-                rated_commits.extend(batch)
-                success = True
-                logger.info(f"Successfully rated batch {i//batch_size + 1}")
+                logger.info(f"Successfully rated batch {batch_number}")
+                return batch
                 
             except Exception as e:
                 retry_count += 1
@@ -169,46 +318,201 @@ def rate_commit_quality(commits: List[Dict[str, str]], batch_size: int = 10) ->
                 
                 if retry_count < max_retries:
                     logger.info(f"Retrying in {wait_time} seconds... (Attempt {retry_count+1}/{max_retries})")
-                    time.sleep(wait_time)
-                else:
-                    logger.error("All retry attempts failed for this batch")
-                    
-                    # Add unrated commits to preserve data
-                    for commit in batch:
-                        commit["quality_score"] = 0
-                        commit["quality_reason"] = "Rating failed"
-                    rated_commits.extend(batch)
-    
-    return rated_commits
-
-def save_rated_commits(commits: List[Dict[str, Any]]) -> str:
-    """Save rated commits to a new CSV file"""
+                    await asyncio.sleep(wait_time)
+        
+        logger.error("All retry attempts failed for this batch")
+        
+        # Add unrated commits to preserve data
+        for commit in batch:
+            commit["quality_score"] = 0
+            commit["quality_reason"] = RATING_FAILED
+        return batch
+
+def _cache_key(commit: Dict[str, Any]) -> str:
+    """Cache key for a commit's rating under the current deployment and prompt"""
+    return make_cache_key(deployment, PROMPT_FINGERPRINT, commit.get('commit_message', 'No message'))
+
+def _is_rated(commit: Dict[str, Any]) -> bool:
+    """Whether a commit received a rating that is worth caching"""
+    return "quality_score" in commit and commit.get("quality_reason") != RATING_FAILED
+
+async def _rate_window(
+    client: AsyncAzureOpenAI,
+    commits: List[Dict[str, Any]],
+    batch_size: int,
+    batch_numbers: Iterator[int],
+    semaphore: asyncio.Semaphore,
+    bucket: TokenBucket,
+    cache: Optional[sqlite3.Connection],
+    semantic_cache: Optional[SemanticCache]
+) -> None:
+    """
+    Rate a window of commits in place, using the caches where possible
+    
+    Args:
+        client: Azure OpenAI client shared by all batches
+        commits: Commits read from the CSV for this window
+        batch_size: Number of commits to process in each API call
+        batch_numbers: Shared counter used to number batches in the logs
+        semaphore: Limits how many batches are in flight at once
+        bucket: Paces requests to the deployment's rate limits
+        cache: Exact-match rating cache, or None when disabled
+        semantic_cache: Near-duplicate rating cache, or None when disabled
+    """
+    # Rate each distinct message once; duplicates get the same rating afterwards
+    duplicates = {}
+    for commit in commits:
+        duplicates.setdefault(commit.get('commit_message', 'No message'), []).append(commit)
+    unique = [group[0] for group in duplicates.values()]
+    if len(unique) < len(commits):
+        logger.info(f"Rating {len(unique)} distinct messages for {len(commits)} commits")
+    
+    # Reuse ratings from previous runs and only send the rest to the API
+    uncached = unique
+    if cache is not None:
+        keys = [_cache_key(commit) for commit in unique]
+        cached_ratings = get_cached_ratings(cache, keys)
+        uncached = []
+        for key, commit in zip(keys, unique):
+            if key in cached_ratings:
+                commit["quality_score"], commit["quality_reason"] = cached_ratings[key]
+            else:
+                uncached.append(commit)
+        logger.info(f"Found {len(unique) - len(uncached)} cached ratings, {len(uncached)} messages left to rate")
+    
+    # Copy ratings from near-duplicate messages, embedding the window in one pass
+    to_rate = uncached
+    if semantic_cache is not None and uncached:
+        embeddings = semantic_cache.encode([commit.get('commit_message', 'No message') for commit in uncached])
+        to_rate = []
+        to_rate_positions = []
+        for position, (commit, rating) in enumerate(zip(uncached, semantic_cache.lookup(embeddings))):
+            if rating is not None:
+                commit["quality_score"], commit["quality_reason"] = rating
+            else:
+                to_rate.append(commit)
+                to_rate_positions.append(position)
+        logger.info(f"Found {len(uncached) - len(to_rate)} similar cached ratings, {len(to_rate)} messages left to rate")
+    
+    # Process commits in batches to manage rate limits. The semaphore caps
+    # how many batches run concurrently, the bucket caps the request rate
+    batches = [to_rate[i:i+batch_size] for i in range(0, len(to_rate), batch_size)]
+    await asyncio.gather(*[
+        _rate_batch(client, batch, next(batch_numbers), semaphore, bucket)
+        for batch in batches
+    ])
+    
+    if semantic_cache is not None and uncached:
+        # Index newly rated messages so later near-duplicates can reuse them
+        rated_positions = [
+            position for position, commit in zip(to_rate_positions, to_rate)
+            if _is_rated(commit)
+        ]
+        semantic_cache.add(
+            embeddings[rated_positions],
+            [(uncached[position]["quality_score"], uncached[position]["quality_reason"]) for position in rated_positions]
+        )
+    
+    if cache is not None:
+        # Only cache commits the API actually rated. Ratings borrowed from a
+        # semantic match are approximate and must not become exact-match entries
+        store_ratings(cache, {
+            _cache_key(commit): (commit["quality_score"], commit["quality_reason"])
+            for commit in to_rate
+            if _is_rated(commit)
+        })
+    
+    # Fan each rating out to the commits that share its message
+    for first, *rest in duplicates.values():
+        if "quality_score" in first:
+            for commit in rest:
+                commit["quality_score"] = first["quality_score"]
+                commit["quality_reason"] = first["quality_reason"]
+
+async def rate_commit_quality(
+    commits: Iterable[Dict[str, str]],
+    batch_size: int = 10,
+    concurrency: int = default_concurrency
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Rate the quality of commits using Azure OpenAI
+    
+    Commits are pulled from the iterable one window at a time, so only
+    enough commits to keep every concurrent batch busy are held in memory.
+    
+    Args:
+        commits: Iterable of commit dictionaries from CSV
+        batch_size: Number of commits to process in each API call
+        concurrency: Maximum number of API calls in flight at once
+        
+    Yields:
+        Lists of commits with added quality scores, in input order
+    """
+    logger.info("Rating quality of commits using Azure OpenAI")
+    client = create_azure_openai_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(requests_per_minute, tokens_per_minute)
+    batch_numbers = itertools.count(1)
+    
+    cache = open_cache(cache_path) if CACHE_ENABLED else None
+    semantic_cache = None
+    if semantic_cache_enabled:
+        semantic_cache = SemanticCache(
+            semantic_cache_path,
+            namespace=f"{deployment}|{PROMPT_FINGERPRINT}",
+            threshold=semantic_cache_threshold
+        )
+    
+    commits = iter(commits)
+    window_size = batch_size * concurrency
+    try:
+        while True:
+            window = list(itertools.islice(commits, window_size))
+            if not window:
+                break
+            await _rate_window(client, window, batch_size, batch_numbers, semaphore, bucket, cache, semantic_cache)
+            yield window
+    finally:
+        if semantic_cache is not None:
+            semantic_cache.save()
+        if cache is not None:
+            cache.close()
+
+async def save_rated_commits(rated_batches: AsyncIterator[List[Dict[str, Any]]]) -> str:
+    """Save rated commits to a new CSV file as each batch completes"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_file = f"rated_commits_{timestamp}.csv"
+    total = 0
     
-    with open(output_file, 'w', newline='', encoding='utf-8') as file:
-        # Get all fieldnames from the first commit
-        fieldnames = list(commits[0].keys())
-        
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(commits)
+    get_commit_fields = itemgetter(*COMMIT_FIELDS)
+    
+    with open(output_file, 'w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as file:
+        writer = csv.writer(file)
+        writer.writerow(RATED_FIELDS)
+        async for batch in rated_batches:
+            # Commits the model skipped have no score and are written with empty cells
+            writer.writerows(
+                get_commit_fields(commit) + (commit.get("quality_score", ""), commit.get("quality_reason", ""))
+                for commit in batch
+            )
+            total += len(batch)
     
-    logger.info(f"Saved rated commits to {output_file}")
+    logger.info(f"Saved {total} rated commits to {output_file}")
     return output_file
 
-def display_top_commits(commits: List[Dict[str, Any]], count: int = 10) -> None:
+def display_top_commits(commits: Iterable[Dict[str, Any]], count: int = 10) -> None:
     """Display the top rated commits"""
     print(f"\n===== TOP {count} QUALITY COMMITS =====\n")
     
-    # Sort commits by quality score (highest first)
-    sorted_commits = sorted(
-        commits, 
-        key=lambda x: float(x.get("quality_score", 0)), 
-        reverse=True
+    # Keep only the highest scores (highest first). nlargest computes the key
+    # once per commit and holds just `count` commits while scanning
+    top_commits = heapq.nlargest(
+        count,
+        commits,
+        key=lambda x: float(x.get("quality_score") or 0)
     )
     
-    for i, commit in enumerate(sorted_commits[:count], 1):
+    for i, commit in enumerate(top_commits, 1):
         print(f"{i}. Score: {commit.get('quality_score', 'N/A')}/10")
         print(f"   Message: {commit.get('commit_message', 'No message')}")
         print(f"   Author: {commit.get('author', 'Unknown')}")
@@ -217,29 +521,32 @@ def display_top_commits(commits: List[Dict[str, Any]], count: int = 10) -> None:
         print(f"   Reason: {commit.get('quality_reason', 'No reason provided')}")
         print()
 
+async def main() -> None:
+    """Test the connection, then rate and report on the latest commits file"""
+    # First test the connection
+    if not await test_azure_connection():
+        logger.error("Failed to connect to Azure OpenAI - cannot proceed")
+        print("Failed to establish connection to Azure OpenAI. Check logs for details.")
+        exit(1)
+    
+    # Find the latest commits file
+    commits_file = find_latest_commits_csv()
+    
+    # Rate the commits, streaming them from the input file to the output file
+    print(f"Rating commits from {commits_file}...")
+    output_file = await save_rated_commits(rate_commit_quality(iter_commits(commits_file)))
+    print(f"Saved rated commits to {output_file}")
+    
+    # Display top commits, read back from the saved file
+    display_top_commits(iter_commits(output_file))
+    
+    # Close the shared client while its event loop is still running
+    await create_azure_openai_client().close()
+    create_azure_openai_client.cache_clear()
+
 if __name__ == "__main__":
     try:
-        # First test the connection
-        if not test_azure_connection():
-            logger.error("Failed to connect to Azure OpenAI - cannot proceed")
-            print("Failed to establish connection to Azure OpenAI. Check logs for details.")
-            exit(1)
-        
-        # Find and read the latest commits file
-        commits_file = find_latest_commits_csv()
-        commits = read_commits_from_csv(commits_file)
-        
-        # Rate the commits
-        print(f"Rating {len(commits)} commits from {commits_file}...")
-        rated_commits = rate_commit_quality(commits)
-        
-        # Save results
-        output_file = save_rated_commits(rated_commits)
-        print(f"Saved rated commits to {output_file}")
-        
-        # Display top commits
-        display_top_commits(rated_commits)
-        
+        asyncio.run(main())
     except Exception as e:
         logger.error(f"Error in main process: {str(e)}")
         print(f"Error: {str(e)}")
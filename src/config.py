@@ -16,6 +16,12 @@ DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
 GITHUB_ORG = os.getenv("GITHUB_ORG", "")
 GITHUB_REPO = os.getenv("GITHUB_REPO", "")
+GITHUB_MAX_WORKERS = int(os.getenv("GITHUB_MAX_WORKERS", "10"))    # Concurrent page fetches per listing
+GITHUB_REPO_WORKERS = int(os.getenv("GITHUB_REPO_WORKERS", "4"))   # Repositories fetched concurrently
+GITHUB_MAX_CONCURRENT_REQUESTS = int(os.getenv("GITHUB_MAX_CONCURRENT_REQUESTS", "10"))  # In flight across all workers
+GITHUB_CACHE_ENABLED = os.getenv("GITHUB_CACHE_ENABLED", "False").lower() == "true"  # Keep ETags and page bodies on disk
+GITHUB_CACHE_PATH = os.getenv("GITHUB_CACHE_PATH", "github_cache")  # ETags and pages from earlier runs
+GITHUB_INCREMENTAL = os.getenv("GITHUB_INCREMENTAL", "False").lower() == "true"  # Only fetch new commits; needs the cache
 
 # Azure OpenAI configuration
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY", "")
@@ -0,0 +1,61 @@
+import hashlib
+import sqlite3
+import time
+
+def open_cache(file_path):
+    """
+    Open the rating cache, creating the table on first use
+    
+    Args:
+        file_path (str): Path to the SQLite database file
+    """
+    conn = sqlite3.connect(file_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS ratings ("
+        "key TEXT PRIMARY KEY, score INT, reason TEXT, ts INT)"
+    )
+    return conn
+
+def make_cache_key(deployment, system_prompt, message):
+    """Build the cache key for one commit message rated by a deployment and prompt"""
+    return hashlib.sha256(f"{deployment}|{system_prompt}|{message}".encode()).hexdigest()
+
+def get_cached_ratings(conn, keys):
+    """
+    Look up cached ratings
+    
+    Args:
+        conn (sqlite3.Connection): Connection returned by open_cache
+        keys (list): Cache keys to look up
+        
+    Returns:
+        dict: Mapping of each cached key to a (score, reason) tuple
+    """
+    keys = list(keys)
+    ratings = {}
+    # Stay below SQLite's limit on the number of bound parameters
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i+500]
+        placeholders = ','.join('?' * len(chunk))
+        rows = conn.execute(
+            f"SELECT key, score, reason FROM ratings WHERE key IN ({placeholders})",
+            chunk
+        )
+        for key, score, reason in rows:
+            ratings[key] = (score, reason)
+    return ratings
+
+def store_ratings(conn, ratings):
+    """
+    Store ratings in the cache
+    
+    Args:
+        conn (sqlite3.Connection): Connection returned by open_cache
+        ratings (dict): Mapping of cache key to a (score, reason) tuple
+    """
+    now = int(time.time())
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO ratings (key, score, reason, ts) VALUES (?, ?, ?, ?)",
+            [(key, score, reason, now) for key, (score, reason) in ratings.items()]
+        )
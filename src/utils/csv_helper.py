@@ -1,13 +1,19 @@
 import csv
 import os
 
+# Columns of the commits CSV, in output order
+COMMIT_FIELDS = ('repository', 'commit_sha', 'commit_message', 'author', 'date', 'url')
+
+# Large buffer for commit exports, which can run to hundreds of MB
+CSV_BUFFER_SIZE = 1 << 20  # 1 MiB
+
 def create_csv_file(file_path, header):
     with open(file_path, mode='w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
         writer.writerow(header)
 
 def write_commit_data_to_csv(file_path, commit_data):
-    with open(file_path, mode='a', newline='', encoding='utf-8') as file:
+    with open(file_path, mode='a', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as file:
         writer = csv.writer(file)
         writer.writerows(commit_data)
 
@@ -29,23 +35,45 @@ def ensure_directory_exists(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def write_commits_to_csv(commits, output_file):
+def write_commits_from_queue(rows_queue, output_file, chunk_size=1000):
     """
-    Write commit data to a CSV file
+    Write commit rows to a CSV file as producers put them on a queue
     
     Args:
-        commits (list): List of dictionaries containing commit data
+        rows_queue (queue.Queue): Lists of commit rows, each row a tuple in
+            COMMIT_FIELDS order. None marks the end of the rows
         output_file (str): Path to the output CSV file
+        chunk_size (int): Number of rows collected before each write
+        
+    Returns:
+        int: Number of rows written
     """
-    if not commits:
-        print("No commits to write.")
-        return
-    
-    fieldnames = commits[0].keys()
-    
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(commits)
+    total = 0
+    finished = False
+    try:
+        with open(output_file, 'w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(COMMIT_FIELDS)
+            
+            chunk = []
+            while True:
+                rows = rows_queue.get()
+                if rows is None:
+                    finished = True
+                    break
+                chunk.extend(rows)
+                if len(chunk) >= chunk_size:
+                    writer.writerows(chunk)
+                    total += len(chunk)
+                    chunk = []
+            
+            writer.writerows(chunk)
+            total += len(chunk)
+    except BaseException:
+        # Keep draining so producers blocked on a full queue can finish
+        while not finished and rows_queue.get() is not None:
+            pass
+        raise
     
-    print(f"Successfully wrote {len(commits)} commits to {output_file}")
\ No newline at end of file
+    print(f"Successfully wrote {total} commits to {output_file}")
+    return total
\ No newline at end of file
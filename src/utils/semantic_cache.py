@@ -0,0 +1,84 @@
+import json
+import os
+
+class SemanticCache:
+    """
+    Reuse ratings of commit messages that are near-duplicates of already rated ones
+    
+    Messages are embedded with a sentence-transformers model and matched by
+    cosine similarity against a FAISS index. The index is persisted to disk
+    together with a parallel list of (score, reason) ratings.
+    """
+    
+    def __init__(self, index_path, namespace, threshold=0.95, model_name='all-MiniLM-L6-v2'):
+        """
+        Load the embedding model and any previously saved index
+        
+        Args:
+            index_path (str): Path of the FAISS index file; ratings are stored next to it
+            namespace (str): Identifies the deployment and prompt the ratings belong to.
+                A saved index with a different namespace is discarded
+            threshold (float): Minimum cosine similarity for a match
+            model_name (str): sentence-transformers model used for embeddings
+        """
+        # Imported here so these heavy dependencies are only needed when the cache is enabled
+        import faiss
+        from sentence_transformers import SentenceTransformer
+        
+        self.faiss = faiss
+        self.model = SentenceTransformer(model_name)
+        self.index_path = index_path
+        self.ratings_path = f"{index_path}.json"
+        self.namespace = namespace
+        self.threshold = threshold
+        self.index = None
+        self.ratings = []
+        
+        if os.path.exists(self.index_path) and os.path.exists(self.ratings_path):
+            with open(self.ratings_path, mode='r', encoding='utf-8') as file:
+                saved = json.load(file)
+            if saved.get('namespace') == namespace:
+                self.index = faiss.read_index(self.index_path)
+                self.ratings = [tuple(rating) for rating in saved.get('ratings', [])]
+        
+        if self.index is None:
+            self.index = faiss.IndexFlatIP(self.model.get_sentence_embedding_dimension())
+    
+    def encode(self, messages):
+        """Embed messages as normalized vectors so inner product equals cosine similarity"""
+        return self.model.encode(
+            messages,
+            batch_size=64,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        ).astype('float32')
+    
+    def lookup(self, embeddings):
+        """
+        Find cached ratings for embedded messages
+        
+        Returns:
+            list: A (score, reason) tuple for each embedding with a close enough
+                match, otherwise None
+        """
+        if self.index.ntotal == 0:
+            return [None] * len(embeddings)
+        
+        similarities, ids = self.index.search(embeddings, 1)
+        return [
+            self.ratings[match[0]] if similarity[0] >= self.threshold else None
+            for similarity, match in zip(similarities, ids)
+        ]
+    
+    def add(self, embeddings, ratings):
+        """Add embedded messages and their (score, reason) ratings to the index"""
+        if len(ratings) == 0:
+            return
+        self.index.add(embeddings)
+        self.ratings.extend(ratings)
+    
+    def save(self):
+        """Persist the index and its ratings"""
+        self.faiss.write_index(self.index, self.index_path)
+        with open(self.ratings_path, mode='w', encoding='utf-8') as file:
+            json.dump({'namespace': self.namespace, 'ratings': self.ratings}, file)